@@ -6,7 +6,7 @@ from pathlib import Path
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from src.api import public, streaming, torrents
@@ -22,7 +22,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- App Initialization ---
-app = FastAPI(title="Torrent Streamer")
+# orjson serializes the status/file-list payloads several times faster than json
+app = FastAPI(
+    title="Torrent Streamer",
+    default_response_class=ORJSONResponse,
+)
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -77,7 +81,7 @@ async def startup_event():
         logger.error(f"Error starting background tasks: {e}")
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     """
     On shutdown, save resume data for active torrents.
     """
@@ -85,9 +89,12 @@ def shutdown_event():
     try:
         ses = get_session()
         ses.post_torrent_updates()
-        # Give some time for alerts to be processed
-        import time
-        time.sleep(2)
+        # Drain alerts until libtorrent goes quiet (at most ~2s) without
+        # blocking the event loop for in-flight responses.
+        for _ in range(20):
+            await asyncio.sleep(0.1)
+            if not ses.pop_alerts():
+                break
         logger.info("Resume data saved ✓")
     except Exception as e:
         logger.error(f"Error during shutdown: {e}")
@@ -151,5 +158,7 @@ if __name__ == "__main__":
         app, 
         host="0.0.0.0", 
         port=PORT,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file
@@ -1,26 +1,45 @@
 
 import asyncio
+import itertools
 import json
 import logging
 import mimetypes
 import os
 import signal
+import time
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Set
 
 import libtorrent as lt
 from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import FileResponse, Response
 
-from src.config import DOWNLOAD_PATH, HLS_PATH
-from src.state import active_torrents
-from src.utils import get_preferred_stream_file
+try:
+    from watchfiles import Change, awatch
+except ImportError:  # watchfiles ships with uvicorn[standard]; poll without it
+    awatch = None
+
+from src.config import (
+    DOWNLOAD_PATH,
+    HLS_ACCEL_REDIRECT_PREFIX,
+    HLS_PATH,
+    WARM_CACHE_SIZE_MB,
+    WARM_CACHE_TIMEOUT_MINUTES,
+)
+from src.state import active_torrents, hls_streaming_ids, notify_state_changed, schedule_hls_expiry
+from src.utils import (
+    build_file_list,
+    get_cached_torrent_info,
+    get_preferred_stream_file,
+    get_status_snapshot,
+)
 
 router = APIRouter()
 
 HLS_SEGMENT_DURATION_SECONDS = 10
-HLS_COMMAND_VERSION = 5
+HLS_COMMAND_VERSION = 6
 MIN_STARTUP_BUFFER_BYTES = 8 * 1024 * 1024
 MAX_STARTUP_BUFFER_BYTES = 32 * 1024 * 1024
 STARTUP_BUFFER_SEGMENTS = 2
@@ -31,6 +50,13 @@ PROBE_BUFFER_BYTES = 4 * 1024 * 1024
 INITIAL_BUFFER_WAIT_SECONDS = 60
 PLAYLIST_WAIT_SECONDS = 120
 SEGMENT_WAIT_SECONDS = 30
+METADATA_WAIT_SECONDS = 30
+FFMPEG_STDERR_TAIL_LINES = 200
+# Segment fetches within this many seconds of the last stamp don't re-stamp.
+ACCESS_STAMP_MIN_INTERVAL_SECONDS = 1
+# Every seek restarts ffmpeg numbering from segment000.ts, so the same name can
+# hold different media; clients must revalidate instead of reusing a copy.
+SEGMENT_CACHE_CONTROL = "no-cache"
 HLS_ARTIFACT_LOG_SECONDS = 5
 FFMPEG_PACE_CHECK_SECONDS = 0.25
 FFMPEG_MIN_AHEAD_BYTES = 16 * 1024 * 1024
@@ -45,6 +71,10 @@ HLS_MPEGTS_VIDEO_BITSTREAM_FILTERS = {
 HLS_AUDIO_COPY_CODECS = {"aac"}
 SOURCE_FILE_WAIT_SECONDS = 120
 
+# ffmpeg processes _terminate_hls_process is stopping, so _watch_ffmpeg_exit
+# doesn't report the SIGTERM/SIGKILL exit of a seek or cleanup as a failure.
+_stopping_ffmpeg_processes: Set[asyncio.subprocess.Process] = set()
+
 
 def _normalize_codec_name(codec_name):
     if not isinstance(codec_name, str):
@@ -71,8 +101,11 @@ def _get_hls_video_args(video_codec, source_file_path=None):
     return [
         '-c:v', 'libx264',
         '-preset', 'veryfast',
+        '-tune', 'zerolatency',
         '-crf', '23',
         '-pix_fmt', 'yuv420p',
+        # Keyframe on every segment boundary regardless of the source frame rate
+        '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_DURATION_SECONDS})',
     ]
 
 
@@ -121,20 +154,24 @@ def _get_video_file_and_index(torrent_info, file_index=None):
         return None, None
 
     if file_index is not None:
+        # Files are stored in torrent order, so the index is normally the position.
+        if file_index < len(files) and files[file_index].get("index") == file_index:
+            return files[file_index], file_index
         for file_info in files:
             if file_info.get("index") == file_index:
                 return file_info, file_info.get("index")
         return None, None
 
-    video_file = get_preferred_stream_file(files)
+    # The file list is fixed once metadata arrives, so the preferred file is
+    # picked once (normally by alert_listener) and reused.
+    video_file = torrent_info.get("video_file")
+    if video_file is None:
+        video_file = get_preferred_stream_file(files)
+        torrent_info["video_file"] = video_file
     if not video_file:
         return None, None
 
-    for file_info in files:
-        if file_info.get("index") == video_file.get("index"):
-            return video_file, file_info.get("index")
-
-    return video_file, None
+    return video_file, video_file.get("index")
 
 
 def _get_source_file_path(file_info):
@@ -163,23 +200,38 @@ def _get_torrent_lock(torrent_info):
     return lock
 
 
-def _are_pieces_available(handle, start_piece, end_piece):
-    try:
-        pieces = getattr(handle.status(), "pieces", None)
-    except RuntimeError:
-        return False
+def _get_have_pieces(torrent_info):
+    """
+    Returns a bytearray with one flag per piece, seeded once from
+    handle.status().pieces and then kept current by alert_listener on each
+    piece_finished_alert, so availability checks don't copy the whole
+    bitfield out of libtorrent. Returns None until metadata is known.
+    """
+    have_pieces = torrent_info.get("have_pieces")
+    if have_pieces is not None:
+        return have_pieces
 
     try:
-        piece_count = len(pieces) if pieces is not None else 0
-    except TypeError:
-        piece_count = 0
+        pieces = getattr(torrent_info["handle"].status(), "pieces", None)
+        have_pieces = bytearray(1 if has_piece else 0 for has_piece in pieces or ())
+    except (RuntimeError, TypeError):
+        return None
+
+    if not have_pieces:
+        return None
+    torrent_info["have_pieces"] = have_pieces
+    return have_pieces
 
-    if piece_count > 0:
-        if start_piece < 0 or end_piece >= piece_count:
+
+def _are_pieces_available(torrent_info, start_piece, end_piece):
+    have_pieces = _get_have_pieces(torrent_info)
+    if have_pieces is not None:
+        if start_piece < 0 or end_piece >= len(have_pieces):
             return False
 
-        return all(pieces[piece] for piece in range(start_piece, end_piece + 1))
+        return have_pieces.find(0, start_piece, end_piece + 1) == -1
 
+    handle = torrent_info["handle"]
     try:
         return all(handle.have_piece(piece) for piece in range(start_piece, end_piece + 1))
     except (AttributeError, RuntimeError):
@@ -187,9 +239,10 @@ def _are_pieces_available(handle, start_piece, end_piece):
 
 
 def _is_torrent_complete(torrent_info):
-    handle = torrent_info["handle"]
+    if torrent_info.get("status") == "completed":
+        return True
     try:
-        status = handle.status()
+        status = get_status_snapshot(torrent_info)
     except RuntimeError:
         return False
 
@@ -197,7 +250,34 @@ def _is_torrent_complete(torrent_info):
     if callable(is_seeding):
         is_seeding = is_seeding()
 
-    return bool(is_seeding) or status.progress >= 0.9999 or torrent_info.get("status") == "completed"
+    return bool(is_seeding) or status.progress >= 0.9999
+
+
+def _get_file_layout(torrent_info, file_index):
+    """
+    Returns the file's torrent offset, size and the piece length, cached on the
+    torrent so byte->piece math doesn't call into libtorrent on every check.
+    """
+    layouts = torrent_info.get("file_layouts")
+    if layouts is None:
+        layouts = {}
+        torrent_info["file_layouts"] = layouts
+
+    layout = layouts.get(file_index)
+    if layout is None:
+        ti = get_cached_torrent_info(torrent_info)
+        file_storage = ti.files()
+        layout = {
+            "offset": file_storage.file_offset(file_index),
+            "size": file_storage.file_size(file_index),
+            "piece_length": ti.piece_length(),
+        }
+        layouts[file_index] = layout
+    return layout
+
+
+def _piece_for_offset(layout, byte_offset):
+    return (layout["offset"] + byte_offset) // layout["piece_length"]
 
 
 def _reprioritize_for_offset(torrent_info, file_index, byte_offset):
@@ -205,24 +285,20 @@ def _reprioritize_for_offset(torrent_info, file_index, byte_offset):
         return
 
     handle = torrent_info["handle"]
-    ti = handle.get_torrent_info()
-    file_entry = ti.file_at(file_index)
-    if file_entry.size <= 0:
+    layout = _get_file_layout(torrent_info, file_index)
+    file_size = layout["size"]
+    if file_size <= 0:
         return
 
-    file_start_piece = ti.map_file(file_index, 0, 1).piece
-    current_piece = ti.map_file(file_index, min(byte_offset, file_entry.size - 1), 1).piece
-    window_end_piece = ti.map_file(
-        file_index,
-        min(file_entry.size - 1, byte_offset + SEEK_WINDOW_BYTES),
-        1,
-    ).piece
+    file_start_piece = _piece_for_offset(layout, 0)
+    current_piece = _piece_for_offset(layout, min(byte_offset, file_size - 1))
+    window_end_piece = _piece_for_offset(layout, min(file_size - 1, byte_offset + SEEK_WINDOW_BYTES))
 
     current_priorities = list(handle.get_piece_priorities())
     priorities = current_priorities[:]
     changed = False
 
-    file_end_piece = ti.map_file(file_index, file_entry.size - 1, 1).piece
+    file_end_piece = _piece_for_offset(layout, file_size - 1)
     for piece in range(file_start_piece, file_end_piece + 1):
         if piece < current_piece:
             priority = 1
@@ -240,17 +316,16 @@ def _reprioritize_for_offset(torrent_info, file_index, byte_offset):
 
 
 def _get_piece_window(torrent_info, file_index, byte_offset, window_bytes):
-    handle = torrent_info["handle"]
-    ti = handle.get_torrent_info()
-    file_entry = ti.file_at(file_index)
-    if file_entry.size <= 0:
+    layout = _get_file_layout(torrent_info, file_index)
+    file_size = layout["size"]
+    if file_size <= 0:
         return None, None
 
-    start_offset = max(0, min(byte_offset, file_entry.size - 1))
-    end_offset = max(start_offset, min(file_entry.size - 1, start_offset + window_bytes))
+    start_offset = max(0, min(byte_offset, file_size - 1))
+    end_offset = max(start_offset, min(file_size - 1, start_offset + window_bytes))
 
-    start_piece = ti.map_file(file_index, start_offset, 1).piece
-    end_piece = ti.map_file(file_index, end_offset, 1).piece
+    start_piece = _piece_for_offset(layout, start_offset)
+    end_piece = _piece_for_offset(layout, end_offset)
     return start_piece, end_piece
 
 
@@ -266,22 +341,17 @@ def _get_piece_window_status(torrent_info, file_index, byte_offset, window_bytes
     if start_piece is None or end_piece is None:
         return None, None, 0, 0
 
-    handle = torrent_info["handle"]
     total = end_piece - start_piece + 1
-    try:
-        pieces = getattr(handle.status(), "pieces", None)
-    except RuntimeError:
-        return start_piece, end_piece, 0, total
+    have_pieces = _get_have_pieces(torrent_info)
+    if have_pieces is not None:
+        return start_piece, end_piece, have_pieces.count(1, start_piece, end_piece + 1), total
 
+    handle = torrent_info["handle"]
     available = 0
     for piece in range(start_piece, end_piece + 1):
         try:
-            piece_count = len(pieces) if pieces is not None else 0
-            if piece_count > 0:
-                has_piece = piece < piece_count and pieces[piece]
-            else:
-                has_piece = handle.have_piece(piece)
-        except (AttributeError, RuntimeError, TypeError):
+            has_piece = handle.have_piece(piece)
+        except (AttributeError, RuntimeError):
             has_piece = False
 
         if has_piece:
@@ -297,13 +367,65 @@ def _request_piece_window(torrent_info, file_index, byte_offset, window_bytes):
 
     handle = torrent_info["handle"]
     _reprioritize_for_offset(torrent_info, file_index, byte_offset)
+    have_pieces = _get_have_pieces(torrent_info)
     for piece in range(start_piece, end_piece + 1):
+        if have_pieces is not None and piece < len(have_pieces) and have_pieces[piece]:
+            continue  # Already downloaded; a deadline would only cost a libtorrent call
         try:
             handle.set_piece_deadline(piece, (piece - start_piece) * 250)
         except (AttributeError, RuntimeError, TypeError):
             return
 
 
+def _prioritize_stream_file(torrent_info, file_index):
+    """Puts the streamed file at top priority and every other file at low."""
+    priorities = [1] * len(torrent_info["files"])
+    priorities[file_index] = 7
+    priorities = tuple(priorities)
+    # Re-sending identical file priorities still walks every file in libtorrent
+    # and resets the piece priorities set for the current read position.
+    if torrent_info.get("file_priorities") != priorities:
+        torrent_info["handle"].prioritize_files(list(priorities))
+        torrent_info["file_priorities"] = priorities
+
+
+def _warm_stream_head(torrent_info, file_index, warm_bytes):
+    """
+    Prioritizes a file for streaming and puts staggered deadlines on the pieces
+    covering its first warm_bytes, so playback can start without waiting on
+    rarest-first piece selection.
+    """
+    _prioritize_stream_file(torrent_info, file_index)
+    _request_piece_window(torrent_info, file_index, 0, warm_bytes)
+
+
+def _warm_preferred_video(torrent_info):
+    video_file = torrent_info.get("video_file")
+    if WARM_CACHE_SIZE_MB <= 0 or not video_file or not video_file.get("is_video"):
+        return
+    try:
+        _warm_stream_head(torrent_info, video_file["index"], WARM_CACHE_SIZE_MB * 1024 * 1024)
+    except RuntimeError as exc:
+        logging.warning(f"Could not prioritize stream head for {torrent_info.get('name')}: {exc}")
+
+
+def _apply_metadata(torrent_info, info, files, video_file):
+    """
+    Fills in the entry once metadata is known: file list, preferred video and
+    status, then warms the video head and releases metadata_ready waiters.
+    """
+    torrent_info["info"] = info
+    torrent_info["name"] = info.name()
+    torrent_info["files"] = files
+    torrent_info["video_file"] = video_file
+    torrent_info["status"] = "downloading"
+    _warm_preferred_video(torrent_info)
+    metadata_ready = torrent_info.get("metadata_ready")
+    if metadata_ready:
+        metadata_ready.set()
+    notify_state_changed()
+
+
 def _enable_streaming_download_mode(handle):
     try:
         handle.set_sequential_download(True)
@@ -319,7 +441,23 @@ def _is_byte_range_available(torrent_info, file_index, byte_offset, window_bytes
     if start_piece is None or end_piece is None:
         return False
 
-    return _are_pieces_available(torrent_info["handle"], start_piece, end_piece)
+    return _are_pieces_available(torrent_info, start_piece, end_piece)
+
+
+def _add_piece_waiter(torrent_info, start_piece, end_piece):
+    """
+    Registers an event that alert_listener sets when a piece in
+    [start_piece, end_piece] finishes, so waiters only wake for pieces they need.
+    """
+    waiter = (start_piece, end_piece, asyncio.Event())
+    torrent_info.setdefault("piece_waiters", []).append(waiter)
+    return waiter
+
+
+def _remove_piece_waiter(torrent_info, waiter):
+    waiters = torrent_info.get("piece_waiters", [])
+    if waiter in waiters:
+        waiters.remove(waiter)
 
 
 async def _wait_for_initial_buffer(torrent_info, file_index, file_size):
@@ -352,35 +490,58 @@ async def _wait_for_byte_range(
     next_log_time = 0
     _request_piece_window(torrent_info, file_index, byte_offset, window_bytes)
 
-    while loop.time() < deadline:
-        if _is_byte_range_available(torrent_info, file_index, byte_offset, window_bytes):
-            return
-        if loop.time() >= next_log_time:
-            start_piece, end_piece, available, total = _get_piece_window_status(
-                torrent_info,
-                file_index,
-                byte_offset,
-                window_bytes,
-            )
-            logging.info(
-                "Waiting for %s at %.1f MiB: pieces %s/%s (%s-%s)",
-                wait_name,
-                byte_offset / (1024 * 1024),
-                available,
-                total,
-                start_piece,
-                end_piece,
-            )
-            _request_piece_window(torrent_info, file_index, byte_offset, window_bytes)
-            next_log_time = loop.time() + 5
-        await asyncio.sleep(1)
+    start_piece, end_piece = _get_piece_window(torrent_info, file_index, byte_offset, window_bytes)
+    waiter = _add_piece_waiter(
+        torrent_info,
+        start_piece if start_piece is not None else 0,
+        end_piece if end_piece is not None else -1,
+    )
+    piece_event = waiter[2]
+    try:
+        while loop.time() < deadline:
+            # Clear before checking so a piece finishing in between still wakes us.
+            piece_event.clear()
+            if _is_byte_range_available(torrent_info, file_index, byte_offset, window_bytes):
+                return
+            if loop.time() >= next_log_time:
+                start_piece, end_piece, available, total = _get_piece_window_status(
+                    torrent_info,
+                    file_index,
+                    byte_offset,
+                    window_bytes,
+                )
+                logging.info(
+                    "Waiting for %s at %.1f MiB: pieces %s/%s (%s-%s)",
+                    wait_name,
+                    byte_offset / (1024 * 1024),
+                    available,
+                    total,
+                    start_piece,
+                    end_piece,
+                )
+                _request_piece_window(torrent_info, file_index, byte_offset, window_bytes)
+                next_log_time = loop.time() + 5
+            try:
+                await asyncio.wait_for(piece_event.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _remove_piece_waiter(torrent_info, waiter)
 
     raise HTTPException(status_code=503, detail=f"{wait_name} not ready")
 
 
+def _stat_if_ready(path):
+    """Returns the file's stat_result if it exists and is non-empty, else None."""
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result if stat_result.st_size > 0 else None
+
+
 def _playlist_exists(playlist_path):
-    path = Path(playlist_path)
-    return path.exists() and path.stat().st_size > 0
+    return _stat_if_ready(playlist_path) is not None
 
 
 def _can_reuse_hls_playlist(torrent_info, playlist_path, start_segment):
@@ -511,6 +672,7 @@ async def _terminate_hls_process(torrent_info):
         pacer_task.cancel()
     torrent_info["hls_pacer_task"] = None
 
+    hls_streaming_ids.discard(torrent_info.get("hash"))
     process = torrent_info.get("hls_process")
     if not process or process.returncode is not None:
         torrent_info["hls_process"] = None
@@ -524,9 +686,12 @@ async def _terminate_hls_process(torrent_info):
             pass
         torrent_info["hls_process_paused"] = False
 
-    process.terminate()
+    _stopping_ffmpeg_processes.add(process)
     try:
+        process.terminate()
         await asyncio.wait_for(process.wait(), timeout=10)
+    except ProcessLookupError:
+        pass  # Already exited
     except asyncio.TimeoutError:
         process.kill()
         await process.wait()
@@ -537,12 +702,45 @@ async def _terminate_hls_process(torrent_info):
 
 def _clear_hls_output_dir(hls_output_dir):
     os.makedirs(hls_output_dir, exist_ok=True)
-    for existing_path in Path(hls_output_dir).glob("*"):
-        if existing_path.is_file():
-            existing_path.unlink()
+    # scandir's is_file() uses the directory entry type, so this is one unlink
+    # per segment rather than a stat plus an unlink.
+    with os.scandir(hls_output_dir) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+class _FsDescription:
+    """
+    Log argument for the HLS diagnostics below. The stat/scandir work only
+    runs when the record is formatted with DEBUG enabled; otherwise it
+    renders as the bare path, so log lines on the event loop stay off disk.
+    """
+
+    __slots__ = ("_describe", "_path")
+
+    def __init__(self, describe, path):
+        self._describe = describe
+        self._path = path
+
+    def __str__(self):
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            return self._describe(self._path)
+        return str(self._path)
 
 
 def _describe_path(path):
+    return _FsDescription(_stat_description, path)
+
+
+def _describe_directory_entries(directory_path):
+    return _FsDescription(_directory_entries_description, directory_path)
+
+
+def _stat_description(path):
     path = Path(path)
     try:
         stat_result = path.stat()
@@ -556,19 +754,22 @@ def _describe_path(path):
     return f"{path} ({path_type}, size={stat_result.st_size}B, mtime={modified_at})"
 
 
-def _describe_directory_entries(directory_path, max_entries=12):
+def _directory_entries_description(directory_path, max_entries=12):
     directory_path = Path(directory_path)
     try:
-        if not directory_path.exists():
-            return f"{directory_path} (missing)"
-        if not directory_path.is_dir():
-            return f"{directory_path} (not_directory)"
-        entries = sorted(directory_path.iterdir(), key=lambda path: path.name)
+        # Only pull as many entries as we log; large download/HLS directories
+        # must not be enumerated in full just to build a diagnostic line.
+        with os.scandir(directory_path) as scanner:
+            entries = list(itertools.islice(scanner, max_entries + 1))
+    except FileNotFoundError:
+        return f"{directory_path} (missing)"
+    except NotADirectoryError:
+        return f"{directory_path} (not_directory)"
     except OSError as exc:
         return f"{directory_path} (list_error={exc})"
 
     descriptions = []
-    for entry in entries[:max_entries]:
+    for entry in sorted(entries[:max_entries], key=lambda entry: entry.name):
         try:
             stat_result = entry.stat()
             suffix = "/" if entry.is_dir() else ""
@@ -577,7 +778,7 @@ def _describe_directory_entries(directory_path, max_entries=12):
             descriptions.append(f"{entry.name}:stat_error={exc}")
 
     if len(entries) > max_entries:
-        descriptions.append(f"+{len(entries) - max_entries} more")
+        descriptions.append("+more")
 
     entries_text = ", ".join(descriptions) if descriptions else "empty"
     return f"{directory_path} [{entries_text}]"
@@ -631,7 +832,8 @@ def _build_ffmpeg_cmd(
         '-hls_time', str(HLS_SEGMENT_DURATION_SECONDS),
         '-hls_list_size', '0',
         '-hls_playlist_type', 'event',
-        '-hls_flags', 'independent_segments',
+        # temp_file: segments appear under their final name only once complete
+        '-hls_flags', 'independent_segments+temp_file',
         '-hls_segment_type', 'mpegts',
         '-hls_base_url', f'/api/stream/{torrent_id}/',
         '-start_number', '0',
@@ -641,16 +843,26 @@ def _build_ffmpeg_cmd(
     return ffmpeg_cmd
 
 
-async def _log_ffmpeg_stderr(process, torrent_id):
+async def _log_ffmpeg_stderr(process, torrent_id, stderr_tail):
+    """
+    Drains ffmpeg's stderr so the pipe never fills, keeping only the last
+    FFMPEG_STDERR_TAIL_LINES lines for _watch_ffmpeg_exit to report.
+    """
     if not process.stderr:
         logging.warning("FFmpeg stderr unavailable for %s pid=%s", torrent_id, process.pid)
         return
 
-    while True:
-        line = await process.stderr.readline()
-        if not line:
-            break
-        logging.warning(f"[ffmpeg:{torrent_id}] {line.decode(errors='replace').rstrip()}")
+    try:
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            line = line.decode(errors='replace').rstrip()
+            stderr_tail.append(line)
+            logging.debug("[ffmpeg:%s] %s", torrent_id, line)
+    except Exception as e:
+        logging.warning("Stopped reading FFmpeg stderr for %s: %s", torrent_id, e)
+        return
 
     logging.info(
         "FFmpeg stderr closed for %s pid=%s returncode=%s",
@@ -660,8 +872,13 @@ async def _log_ffmpeg_stderr(process, torrent_id):
     )
 
 
-async def _watch_ffmpeg_exit(process, torrent_id, hls_output_dir, playlist_path):
+async def _watch_ffmpeg_exit(process, torrent_id, hls_output_dir, playlist_path, stderr_tail):
     returncode = await process.wait()
+    if process in _stopping_ffmpeg_processes:
+        _stopping_ffmpeg_processes.discard(process)
+        logging.info("FFmpeg stopped for %s pid=%s returncode=%s", torrent_id, process.pid, returncode)
+        return
+
     log = logging.info if returncode == 0 else logging.warning
     log(
         "FFmpeg exited for %s pid=%s returncode=%s playlist=%s output_dir=%s",
@@ -671,6 +888,8 @@ async def _watch_ffmpeg_exit(process, torrent_id, hls_output_dir, playlist_path)
         _describe_path(playlist_path),
         _describe_directory_entries(hls_output_dir),
     )
+    if returncode != 0 and stderr_tail:
+        logging.warning("[ffmpeg:%s] last stderr lines:\n%s", torrent_id, "\n".join(stderr_tail))
 
 
 def _latest_segment_index(hls_output_dir):
@@ -821,6 +1040,10 @@ async def _pace_ffmpeg_process(torrent_id, torrent_info, process, file_index, hl
 
 
 async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index=None):
+    if active_torrents.get(torrent_id) is not torrent_info:
+        # Removed while this request waited for the stream lock
+        raise HTTPException(status_code=404, detail="Torrent not found")
+
     handle = torrent_info["handle"]
     if handle.status().paused:
         handle.resume()
@@ -833,9 +1056,7 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
     if video_file_index is None:
         raise HTTPException(status_code=409, detail="File index not ready")
 
-    priorities = [1] * len(torrent_info["files"])
-    priorities[video_file_index] = 7
-    handle.prioritize_files(priorities)
+    _prioritize_stream_file(torrent_info, video_file_index)
     _enable_streaming_download_mode(handle)
 
     torrent_info["video_file_index"] = video_file_index
@@ -848,7 +1069,7 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
 
     hls_output_dir = os.path.join(HLS_PATH, torrent_id)
     playlist_path = os.path.join(hls_output_dir, "stream.m3u8")
-    _clear_hls_output_dir(hls_output_dir)
+    await asyncio.to_thread(_clear_hls_output_dir, hls_output_dir)
     logging.info(
         "Prepared HLS output for %s: playlist=%s output_dir=%s",
         torrent_id,
@@ -857,9 +1078,11 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
     )
 
     source_file_path = str(_get_source_file_path(video_file))
-    while not os.path.exists(source_file_path):
-        logging.info(f"Waiting for source file to exist: {source_file_path}")
-        await asyncio.sleep(1)
+    await _wait_for_hls_artifact(
+        source_file_path,
+        SOURCE_FILE_WAIT_SECONDS,
+        artifact_name="source file",
+    )
     logging.info(
         "HLS source ready for %s: source=%s expected_torrent_file_size=%s",
         torrent_id,
@@ -938,6 +1161,7 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
         stderr=asyncio.subprocess.PIPE,
     )
     torrent_info["hls_process"] = process
+    hls_streaming_ids.add(torrent_id)
     torrent_info["hls_start_segment"] = start_segment
     torrent_info["hls_command_version"] = HLS_COMMAND_VERSION
     torrent_info["hls_realtime_input"] = realtime_input
@@ -949,8 +1173,9 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
         playlist_path,
         _describe_directory_entries(hls_output_dir),
     )
-    asyncio.create_task(_log_ffmpeg_stderr(process, torrent_id))
-    asyncio.create_task(_watch_ffmpeg_exit(process, torrent_id, hls_output_dir, playlist_path))
+    stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+    asyncio.create_task(_log_ffmpeg_stderr(process, torrent_id, stderr_tail))
+    asyncio.create_task(_watch_ffmpeg_exit(process, torrent_id, hls_output_dir, playlist_path, stderr_tail))
     torrent_info["hls_pacer_task"] = asyncio.create_task(
         _pace_ffmpeg_process(
             torrent_id,
@@ -966,6 +1191,104 @@ async def _start_hls_process(torrent_id, torrent_info, start_segment, file_index
     return playlist_path
 
 
+def _is_added_change(change, path):
+    # Waiters only care about files appearing (ffmpeg's temp_file renames
+    # count as added); libtorrent's writes to existing files are ignored.
+    return change == Change.added
+
+
+class _DirectoryWatcher:
+    """
+    A single watchfiles watcher for a directory, shared by every request
+    waiting on files in it, so waiters don't each hold an inotify instance
+    and an anyio worker thread. Each batch of changes sets the current
+    changed event and swaps in a fresh one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.users = 0
+        self.changed = asyncio.Event()
+        self._stop_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            async for _ in awatch(
+                self.directory,
+                watch_filter=_is_added_change,
+                recursive=False,
+                debounce=100,
+                stop_event=self._stop_event,
+            ):
+                self.changed.set()
+                self.changed = asyncio.Event()
+        except Exception as exc:
+            # Waiters still wake on their interval; e.g. the directory was removed
+            logging.debug("Stopped watching %s: %s", self.directory, exc)
+        finally:
+            # Let new waiters start a fresh watcher instead of reusing a dead one
+            if _directory_watchers.get(self.directory) is self:
+                del _directory_watchers[self.directory]
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# Live watchers keyed by directory; removed when their last waiter leaves.
+_directory_watchers: Dict[str, _DirectoryWatcher] = {}
+
+
+def _acquire_directory_watcher(directory):
+    if awatch is None or not os.path.isdir(directory):
+        return None
+    key = str(directory)
+    watcher = _directory_watchers.get(key)
+    if watcher is None:
+        watcher = _DirectoryWatcher(key)
+        _directory_watchers[key] = watcher
+    watcher.users += 1
+    return watcher
+
+
+def _release_directory_watcher(watcher):
+    watcher.users -= 1
+    if watcher.users == 0:
+        watcher.stop()
+        if _directory_watchers.get(watcher.directory) is watcher:
+            del _directory_watchers[watcher.directory]
+
+
+async def _watch_directory_ticks(directory, interval_seconds):
+    """
+    Yields whenever a file is added to directory, and at least every
+    interval_seconds. Uses the directory's shared watcher when watchfiles is
+    available so waiters wake on file creation instead of the next poll;
+    otherwise just sleeps. A directory that doesn't exist yet (ffmpeg output
+    right after startup) is polled until it appears, then watched.
+    """
+    watcher = _acquire_directory_watcher(directory)
+    try:
+        # Grab the event before handing control back so a file added while
+        # the caller checks for it still wakes the next wait.
+        changed = watcher.changed if watcher else None
+        while True:
+            if changed is None:
+                await asyncio.sleep(interval_seconds)
+            else:
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            if watcher is None:
+                watcher = _acquire_directory_watcher(directory)
+            changed = watcher.changed if watcher else None
+            yield
+    finally:
+        if watcher is not None:
+            _release_directory_watcher(watcher)
+
+
 async def _wait_for_hls_artifact(path, timeout_seconds, process=None, artifact_name="artifact"):
     path = Path(path)
     loop = asyncio.get_running_loop()
@@ -973,42 +1296,46 @@ async def _wait_for_hls_artifact(path, timeout_seconds, process=None, artifact_n
     deadline = start_time + timeout_seconds
     next_log_time = start_time
 
-    while loop.time() < deadline:
-        if path.exists() and path.stat().st_size > 0:
-            elapsed_seconds = loop.time() - start_time
-            if artifact_name == "playlist" or elapsed_seconds >= 1:
-                logging.info(
-                    "HLS %s ready after %.1fs: path=%s process=%s output_dir=%s",
+    ticks = _watch_directory_ticks(path.parent, 1)
+    try:
+        while loop.time() < deadline:
+            if await asyncio.to_thread(_playlist_exists, path):
+                elapsed_seconds = loop.time() - start_time
+                if artifact_name == "playlist" or elapsed_seconds >= 1:
+                    logging.info(
+                        "HLS %s ready after %.1fs: path=%s process=%s output_dir=%s",
+                        artifact_name,
+                        elapsed_seconds,
+                        _describe_path(path),
+                        _describe_process(process),
+                        _describe_directory_entries(path.parent),
+                    )
+                return
+            if process and process.returncode is not None:
+                logging.error(
+                    "FFmpeg exited before HLS %s was ready: path=%s process=%s output_dir=%s",
                     artifact_name,
-                    elapsed_seconds,
                     _describe_path(path),
                     _describe_process(process),
                     _describe_directory_entries(path.parent),
                 )
-            return
-        if process and process.returncode is not None:
-            logging.error(
-                "FFmpeg exited before HLS %s was ready: path=%s process=%s output_dir=%s",
-                artifact_name,
-                _describe_path(path),
-                _describe_process(process),
-                _describe_directory_entries(path.parent),
-            )
-            raise HTTPException(status_code=500, detail=f"FFmpeg exited before {artifact_name} was ready")
+                raise HTTPException(status_code=500, detail=f"FFmpeg exited before {artifact_name} was ready")
 
-        now = loop.time()
-        if now >= next_log_time:
-            logging.info(
-                "Waiting for HLS %s: elapsed=%.1fs timeout=%ss path=%s process=%s output_dir=%s",
-                artifact_name,
-                now - start_time,
-                timeout_seconds,
-                _describe_path(path),
-                _describe_process(process),
-                _describe_directory_entries(path.parent),
-            )
-            next_log_time = now + HLS_ARTIFACT_LOG_SECONDS
-        await asyncio.sleep(1)
+            now = loop.time()
+            if now >= next_log_time:
+                logging.info(
+                    "Waiting for HLS %s: elapsed=%.1fs timeout=%ss path=%s process=%s output_dir=%s",
+                    artifact_name,
+                    now - start_time,
+                    timeout_seconds,
+                    _describe_path(path),
+                    _describe_process(process),
+                    _describe_directory_entries(path.parent),
+                )
+                next_log_time = now + HLS_ARTIFACT_LOG_SECONDS
+            await ticks.__anext__()
+    finally:
+        await ticks.aclose()
 
     logging.warning(
         "Timed out waiting for HLS %s after %ss: path=%s process=%s output_dir=%s",
@@ -1021,13 +1348,18 @@ async def _wait_for_hls_artifact(path, timeout_seconds, process=None, artifact_n
     raise HTTPException(status_code=503, detail=f"{artifact_name.capitalize()} not ready")
 
 
+def _read_file_with_sizes(path):
+    initial_size = path.stat().st_size
+    content = path.read_bytes()
+    final_size = path.stat().st_size
+    return initial_size, content, final_size
+
+
 async def _read_hls_playlist_snapshot(playlist_path):
     path = Path(playlist_path)
     for _ in range(5):
         try:
-            initial_size = path.stat().st_size
-            content = path.read_bytes()
-            final_size = path.stat().st_size
+            initial_size, content, final_size = await asyncio.to_thread(_read_file_with_sizes, path)
         except FileNotFoundError:
             await asyncio.sleep(0.05)
             continue
@@ -1043,6 +1375,33 @@ async def _read_hls_playlist_snapshot(playlist_path):
     raise HTTPException(status_code=503, detail="Playlist not ready")
 
 
+def _mark_hls_access(torrent_id, torrent_info):
+    """
+    Stamps HLS activity for cleanup_inactive_streams. Players fetch segments
+    in bursts, so stamps closer together than ACCESS_STAMP_MIN_INTERVAL_SECONDS
+    are coalesced.
+    """
+    now = time.monotonic()
+    last_accessed = torrent_info.get("hls_last_accessed")
+    if last_accessed is not None and now - last_accessed < ACCESS_STAMP_MIN_INTERVAL_SECONDS:
+        return
+    torrent_info["hls_last_accessed"] = now
+    torrent_info["last_activity_at"] = now
+    # Later stamps don't need a heap push; cleanup re-schedules from
+    # hls_last_accessed when the pending deadline comes up.
+    if torrent_info.get("hls_expiry_deadline") is None:
+        schedule_hls_expiry(torrent_id, torrent_info, now + WARM_CACHE_TIMEOUT_MINUTES * 60)
+
+
+def _accel_redirect_response(relative_path, media_type, headers=None):
+    prefix = HLS_ACCEL_REDIRECT_PREFIX.rstrip("/")
+    return Response(
+        status_code=200,
+        media_type=media_type,
+        headers={**(headers or {}), "X-Accel-Redirect": f"{prefix}/{relative_path}"},
+    )
+
+
 def _hls_playlist_response(content):
     return Response(
         content=content,
@@ -1067,30 +1426,28 @@ async def get_hls_playlist(
         raise HTTPException(status_code=404, detail="Torrent not found")
 
     # Update access time
-    now = datetime.now()
-    torrent_info["hls_last_accessed"] = now
-    torrent_info["last_activity_at"] = now
+    _mark_hls_access(torrent_id, torrent_info)
     client_host = request.client.host if request.client else "unknown"
     logging.info("HLS playlist requested for %s from %s start_segment=%s", torrent_id, client_host, segment)
 
     # Find the requested file, or fall back to the preferred stream file.
     video_file, video_file_index = _get_video_file_and_index(torrent_info, file_index=file_index)
+    metadata_ready = torrent_info.get("metadata_ready")
+    if not video_file and metadata_ready is not None and not metadata_ready.is_set():
+        # The metadata handler is still filling in the file list (in a worker
+        # thread for large torrents); wait for it rather than rebuilding here.
+        try:
+            await asyncio.wait_for(metadata_ready.wait(), timeout=METADATA_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Metadata not ready, please wait.")
+        video_file, video_file_index = _get_video_file_and_index(torrent_info, file_index=file_index)
     if not video_file:
         handle = torrent_info["handle"]
         if not handle.has_metadata():
              raise HTTPException(status_code=503, detail="Metadata not ready, please wait.")
-        ti = handle.get_torrent_info()
-        files = []
-        for i in range(ti.num_files()):
-            file_entry = ti.file_at(i)
-            files.append({
-                "index": i,
-                "name": file_entry.path,
-                "size": file_entry.size,
-                "progress": 0.0,
-                "is_video": any(file_entry.path.lower().endswith(ext) for ext in ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.mpg', '.mpeg', '.m4v'])
-            })
-        torrent_info["files"] = files
+        torrent_info["files"], torrent_info["video_file"] = build_file_list(
+            get_cached_torrent_info(torrent_info)
+        )
         video_file, video_file_index = _get_video_file_and_index(torrent_info, file_index=file_index)
         if not video_file:
             raise HTTPException(status_code=404, detail="No file found in torrent.")
@@ -1142,9 +1499,7 @@ async def download_torrent_file(torrent_id: str, file_index: int, request: Reque
     if not torrent_info:
         raise HTTPException(status_code=404, detail="Torrent not found")
 
-    now = datetime.now()
-    torrent_info["hls_last_accessed"] = now
-    torrent_info["last_activity_at"] = now
+    _mark_hls_access(torrent_id, torrent_info)
     client_host = request.client.host if request.client else "unknown"
     logging.info("Download requested for %s file_index=%s from %s", torrent_id, file_index, client_host)
 
@@ -1174,12 +1529,14 @@ async def notify_seek(torrent_id: str, segment: int = Query(..., ge=0)):
     if video_file_index is None:
         raise HTTPException(status_code=409, detail="Video file not ready")
 
+    playlist_path = os.path.join(HLS_PATH, torrent_id, "stream.m3u8")
     async with _get_torrent_lock(torrent_info):
-        await _start_hls_process(torrent_id, torrent_info, start_segment=segment)
+        if _can_reuse_hls_playlist(torrent_info, playlist_path, start_segment=segment):
+            logging.info("Seek for %s to segment %s reuses the running FFmpeg", torrent_id, segment)
+        else:
+            await _start_hls_process(torrent_id, torrent_info, start_segment=segment)
 
-    now = datetime.now()
-    torrent_info["hls_last_accessed"] = now
-    torrent_info["last_activity_at"] = now
+    _mark_hls_access(torrent_id, torrent_info)
     return {"ok": True, "seek_offset_seconds": segment * HLS_SEGMENT_DURATION_SECONDS}
 
 
@@ -1202,7 +1559,7 @@ async def get_stream_metadata(torrent_id: str):
         torrent_info.get("stream_duration_seconds") is None
         or torrent_info.get("stream_video_codec") is None
         or torrent_info.get("stream_bytes_per_second") is None
-    ) and os.path.exists(source_file_path):
+    ) and await asyncio.to_thread(os.path.exists, source_file_path):
         media_info = await _probe_media_info(source_file_path, APPROX_BYTES_PER_SECOND)
         torrent_info["stream_bytes_per_second"] = media_info["bytes_per_second"]
         torrent_info["stream_duration_seconds"] = media_info["duration_seconds"]
@@ -1230,11 +1587,26 @@ async def get_hls_segment(torrent_id: str, segment: str):
     """Serves the individual .ts segment files."""
     torrent_id = torrent_id.lower()
     segment_path = Path(HLS_PATH) / torrent_id / segment
-    await _wait_for_hls_artifact(segment_path, SEGMENT_WAIT_SECONDS, artifact_name="segment")
-    
+    # Segments are usually already on disk; one stat answers both "is it ready"
+    # and what the response needs, so only fall back to waiting when it isn't.
+    stat_result = await asyncio.to_thread(_stat_if_ready, segment_path)
+    if stat_result is None:
+        await _wait_for_hls_artifact(segment_path, SEGMENT_WAIT_SECONDS, artifact_name="segment")
+
     # Update access time on segment access
-    if torrent_id in active_torrents:
-        now = datetime.now()
-        active_torrents[torrent_id]["hls_last_accessed"] = now
-        active_torrents[torrent_id]["last_activity_at"] = now
-    return FileResponse(str(segment_path), media_type='video/MP2T')
+    torrent_info = active_torrents.get(torrent_id)
+    if torrent_info:
+        _mark_hls_access(torrent_id, torrent_info)
+
+    headers = {"Cache-Control": SEGMENT_CACHE_CONTROL}
+    if HLS_ACCEL_REDIRECT_PREFIX:
+        return _accel_redirect_response(f"{torrent_id}/{segment}", 'video/MP2T', headers=headers)
+    if stat_result is None:
+        stat_result = await asyncio.to_thread(os.stat, segment_path)
+    # Hand the stat over so the response doesn't stat again
+    return FileResponse(
+        str(segment_path),
+        media_type='video/MP2T',
+        headers=headers,
+        stat_result=stat_result,
+    )
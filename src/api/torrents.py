@@ -1,7 +1,9 @@
 import asyncio
+import functools
 import logging
 import os
 import shutil
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List
@@ -10,13 +12,24 @@ import libtorrent as lt
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from src.api.streaming import _apply_metadata, _get_torrent_lock, _terminate_hls_process
 from src.config import DOWNLOAD_PATH, HLS_PATH
-from src.state import active_torrents, get_session
-from src.utils import get_torrent_status
+from src.state import (
+    TorrentState,
+    active_torrents,
+    get_session,
+    hls_streaming_ids,
+    notify_state_changed,
+    pending_torrent_adds,
+)
+from src.utils import add_params_hash, build_file_list, get_torrent_status
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+METADATA_WAIT_SECONDS = 30
+ADD_TORRENT_WAIT_SECONDS = 10
+
 # Pydantic Models for API requests and responses
 class TorrentAddRequest(BaseModel):
     magnet_link: str
@@ -38,10 +51,46 @@ class TorrentStatus(BaseModel):
     files: List[FileStatus]
 
 
+def _clear_directory_contents(path):
+    """Deletes everything inside path; a missing path or entry is not an error."""
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+
+
+def _remove_tree(path):
+    """
+    Deletes path recursively, treating a missing path as already removed and
+    logging anything else that fails. Returns True if nothing failed.
+    """
+    failures = []
+
+    def _on_error(function, failed_path, exc_info):
+        if issubclass(exc_info[0], FileNotFoundError):
+            return
+        failures.append(failed_path)
+        logger.error(f"Error cleaning up {failed_path}: {exc_info[1]}")
+
+    shutil.rmtree(path, onerror=_on_error)
+    return not failures
+
+
 async def _remove_torrent_data(torrent_id: str):
-    torrent_info = active_torrents.get(torrent_id)
+    # Claim the entry before any await so a concurrent removal gets a 404
+    torrent_info = active_torrents.pop(torrent_id, None)
     if not torrent_info:
         raise HTTPException(status_code=404, detail="Torrent not found")
+    notify_state_changed()
 
     handle = torrent_info["handle"]
     ses = get_session()
@@ -53,19 +102,75 @@ async def _remove_torrent_data(torrent_id: str):
     except Exception as e:
         logger.error(f"Error removing torrent from session: {e}")
 
-    del active_torrents[torrent_id]
+    # Under the stream lock, so an HLS start already in flight finishes first
+    # and its ffmpeg is stopped here rather than left reading deleted files.
+    async with _get_torrent_lock(torrent_info):
+        if torrent_id in hls_streaming_ids:
+            await _terminate_hls_process(torrent_info)
 
     hls_output_dir = Path(HLS_PATH) / torrent_id
-    if hls_output_dir.exists():
-        try:
-            shutil.rmtree(hls_output_dir)
-            logger.info(f"Cleaned up HLS directory: {hls_output_dir}")
-        except Exception as e:
-            logger.error(f"Error cleaning up HLS directory: {e}")
+    # A missing directory is handled by _remove_tree, without a separate exists() stat
+    if await asyncio.to_thread(_remove_tree, hls_output_dir):
+        logger.info(f"Cleaned up HLS directory: {hls_output_dir}")
 
     return torrent_id
 
 
+def _discard_pending_add(key, future):
+    futures = pending_torrent_adds.get(key)
+    if futures and future in futures:
+        futures.remove(future)
+        if not futures:
+            del pending_torrent_adds[key]
+
+
+def _remove_late_torrent(ses, future):
+    """
+    Done callback for an add that add_torrent stopped waiting on. libtorrent
+    still completes it, so remove the torrent unless another request has
+    registered it by now; otherwise it would download with no entry in
+    active_torrents for any endpoint to list or remove.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    handle = future.result()
+    if not handle.is_valid() or str(handle.info_hash()).lower() in active_torrents:
+        return
+    logger.info(f"Removing torrent added after its request timed out: {handle.info_hash()}")
+    try:
+        ses.remove_torrent(handle, lt.session.delete_files)
+    except Exception as e:
+        logger.error(f"Error removing late torrent from session: {e}")
+
+
+async def _add_to_session(ses, params):
+    """
+    Adds the torrent with async_add_torrent and awaits its add_torrent_alert,
+    so the request never blocks the event loop on libtorrent's session lock.
+    Falls back to the blocking add_torrent on bindings without it.
+    """
+    if not hasattr(ses, "async_add_torrent"):
+        return ses.add_torrent(params)
+
+    key = add_params_hash(params)
+    future = asyncio.get_running_loop().create_future()
+    pending_torrent_adds.setdefault(key, []).append(future)
+    try:
+        ses.async_add_torrent(params)
+    except Exception:
+        _discard_pending_add(key, future)
+        raise
+
+    try:
+        # shield keeps the future pending for _on_add_torrent if we stop waiting
+        return await asyncio.wait_for(asyncio.shield(future), timeout=ADD_TORRENT_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise RuntimeError("Timed out adding torrent") from None
+    finally:
+        if not future.done():
+            future.add_done_callback(functools.partial(_remove_late_torrent, ses))
+
+
 @router.post("", status_code=202, include_in_schema=False)
 @router.post("/", status_code=202)
 async def add_torrent(request: TorrentAddRequest):
@@ -83,14 +188,7 @@ async def add_torrent(request: TorrentAddRequest):
         
         logger.info(f"Adding torrent with save_path: {params.save_path}")
         
-        handle = ses.add_torrent(params)
-        
-        # Wait for the torrent to get info_hash with timeout
-        max_wait = 30  # 30 seconds timeout
-        waited = 0
-        while (not handle.is_valid() or not handle.has_metadata()) and waited < max_wait:
-            await asyncio.sleep(0.1)
-            waited += 0.1
+        handle = await _add_to_session(ses, params)
         
         if not handle.is_valid():
             raise Exception("Failed to get valid torrent handle")
@@ -102,15 +200,36 @@ async def add_torrent(request: TorrentAddRequest):
             logger.info(f"Torrent {torrent_hash} already exists")
             return {"message": "Torrent already exists", "torrent_id": torrent_hash}
 
-        active_torrents[torrent_hash] = {
-            "handle": handle,
-            "status": "metadata",
-            "added_time": datetime.now(),
-            "last_activity_at": datetime.now(),
-            "files": [],
-            "hls_process": None,
-            "hls_last_accessed": None,
-        }
+        # Register before waiting so alert_listener can fill in the file list
+        # and signal metadata_ready as soon as the metadata alert arrives.
+        metadata_ready = asyncio.Event()
+        torrent_state = TorrentState(
+            handle=handle,
+            hash=torrent_hash,
+            status="metadata",
+            added_time=datetime.now(),
+            last_activity_at=time.monotonic(),
+            files=[],
+            hls_process=None,
+            hls_last_accessed=None,
+            metadata_ready=metadata_ready,
+        )
+        active_torrents[torrent_hash] = torrent_state
+        notify_state_changed()
+
+        if handle.has_metadata():
+            # Its metadata alert fired before the entry existed and was
+            # dropped, so fill in the file list the same way the handler does.
+            info = handle.get_torrent_info()
+            files, video_file = await asyncio.to_thread(build_file_list, info)
+            # Skip if the entry was removed, or the alert got there first
+            if active_torrents.get(torrent_hash) is torrent_state and not metadata_ready.is_set():
+                _apply_metadata(torrent_state, info, files, video_file)
+
+        try:
+            await asyncio.wait_for(metadata_ready.wait(), timeout=METADATA_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.info(f"Metadata not received yet for {torrent_hash}; returning early")
         
         return {"message": "Torrent added", "torrent_id": torrent_hash}
 
@@ -150,27 +269,8 @@ async def remove_all_torrents():
         except HTTPException:
             continue
 
-    downloads_path = Path(DOWNLOAD_PATH)
-    if downloads_path.exists():
-        for child in downloads_path.iterdir():
-            try:
-                if child.is_dir():
-                    shutil.rmtree(child)
-                else:
-                    child.unlink()
-            except FileNotFoundError:
-                continue
-
-    hls_path = Path(HLS_PATH)
-    if hls_path.exists():
-        for child in hls_path.iterdir():
-            try:
-                if child.is_dir():
-                    shutil.rmtree(child)
-                else:
-                    child.unlink()
-            except FileNotFoundError:
-                continue
+    await asyncio.to_thread(_clear_directory_contents, DOWNLOAD_PATH)
+    await asyncio.to_thread(_clear_directory_contents, HLS_PATH)
 
     return {
         "message": "All torrent data cleared successfully",
@@ -1,9 +1,12 @@
 import asyncio
+import atexit
+import heapq
 import logging
 import os
 import signal
 import shutil
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import libtorrent as lt
 
@@ -13,53 +16,257 @@ from src.config import (
     INACTIVE_TORRENT_DELETE_MINUTES,
     WARM_CACHE_TIMEOUT_MINUTES,
 )
+from src.api.streaming import _apply_metadata, _get_torrent_lock, _terminate_hls_process
 from src.api.torrents import _remove_torrent_data
-from src.state import active_torrents, get_session
+from src.state import (
+    active_torrents,
+    get_session,
+    get_state_changed_event,
+    hls_expiry_heap,
+    hls_streaming_ids,
+    notify_state_changed,
+    pending_torrent_adds,
+    schedule_hls_expiry,
+)
+from src.utils import add_params_hash, build_file_list, get_status_snapshot
+
+ALERT_WAIT_TIMEOUT_MS = 1000
+# How often cleanup_inactive_streams scans for torrents to delete; HLS expiry
+# runs off hls_expiry_heap deadlines instead.
+CLEANUP_INTERVAL_SECONDS = 60
+# How often alert_listener asks libtorrent for a bulk state_update_alert.
+STATUS_UPDATE_INTERVAL_SECONDS = 1
+# Torrents with more files than this build their file list in a worker thread.
+LARGE_FILE_LIST_THRESHOLD = 500
+
+# Fallback when set_alert_notify isn't available: wait_for_alert blocks its thread
+# for up to ALERT_WAIT_TIMEOUT_MS, so keep it off the default to_thread() pool.
+_alert_wait_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lt-alerts")
+# How long the exit hook lets ffmpeg processes stop after SIGTERM before SIGKILL.
+FFMPEG_EXIT_GRACE_SECONDS = 2
+# Off-loop metadata builds in flight; the loop only keeps weak references to tasks.
+_metadata_tasks = set()
+
+# Info messages from alert handlers, written as one log line per pop_alerts() batch.
+_alert_log_lines = []
+
+
+def _log_alert(message, *args):
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        _alert_log_lines.append(message % args if args else message)
+
+
+def _flush_alert_log():
+    if _alert_log_lines:
+        logging.info("Alerts: %s", "; ".join(_alert_log_lines))
+        _alert_log_lines.clear()
+
+
+async def _apply_metadata_off_loop(info_hash, info):
+    try:
+        files, video_file = await asyncio.to_thread(build_file_list, info)
+        torrent_info = active_torrents.get(info_hash)
+        if torrent_info:  # Not removed while the list was being built
+            _apply_metadata(torrent_info, info, files, video_file)
+            logging.info("Metadata received for %s", info.name())
+    except Exception as exc:
+        logging.error(f"Failed to apply metadata for {info_hash}: {exc}", exc_info=True)
+        torrent_info = active_torrents.get(info_hash)
+        if torrent_info:
+            torrent_info["status"] = "error"
+            torrent_info["error"] = str(exc)
+            notify_state_changed()
+    finally:
+        # Don't leave add_torrent waiting out METADATA_WAIT_SECONDS on a failure
+        torrent_info = active_torrents.get(info_hash)
+        metadata_ready = torrent_info.get("metadata_ready") if torrent_info else None
+        if metadata_ready:
+            metadata_ready.set()
+
+
+def _on_metadata_received(alert):
+    h = alert.handle
+    info_hash = str(h.info_hash())
+    torrent_info = active_torrents.get(info_hash)
+    if not torrent_info:
+        return
+
+    info = h.get_torrent_info()
+    if info.num_files() > LARGE_FILE_LIST_THRESHOLD:
+        # Keep huge file lists from stalling the other alerts in this batch
+        task = asyncio.create_task(_apply_metadata_off_loop(info_hash, info))
+        _metadata_tasks.add(task)
+        task.add_done_callback(_metadata_tasks.discard)
+        return
+    _apply_metadata(torrent_info, info, *build_file_list(info))
+    _log_alert("metadata received for %s", info.name())
+
+
+def _on_torrent_finished(alert):
+    h = alert.handle
+    info_hash = str(h.info_hash())
+    if info_hash in active_torrents:
+        active_torrents[info_hash]["status"] = "completed"
+        notify_state_changed()
+    _log_alert("torrent finished: %s", info_hash)
+
+
+def _on_torrent_error(alert):
+    h = alert.handle
+    info_hash = str(h.info_hash())
+    if info_hash in active_torrents:
+        active_torrents[info_hash]["status"] = "error"
+        active_torrents[info_hash]["error"] = alert.error.message()
+        notify_state_changed()
+    # Errors keep their own line at error level
+    logging.error("Torrent error for %s: %s", info_hash, alert.error.message())
+
+
+def _on_piece_finished(alert):
+    torrent_info = active_torrents.get(str(alert.handle.info_hash()))
+    if not torrent_info:
+        return
+    piece = alert.piece_index
+    # Keep the streaming have-pieces map current once it has been seeded
+    have_pieces = torrent_info.get("have_pieces")
+    if have_pieces is not None and 0 <= piece < len(have_pieces):
+        have_pieces[piece] = 1
+    # Only wake byte-range waiters whose window contains this piece.
+    for start_piece, end_piece, piece_event in torrent_info.get("piece_waiters", ()):
+        if start_piece <= piece <= end_piece:
+            piece_event.set()
+
+
+def _on_state_update(alert):
+    # One alert carries the status of every torrent that changed since the
+    # last post_torrent_updates(); status endpoints read these snapshots.
+    for status in alert.status:
+        torrent_info = active_torrents.get(str(status.handle.info_hash()))
+        if torrent_info:
+            torrent_info["cached_status"] = status
+
+
+def _on_add_torrent(alert):
+    key = add_params_hash(alert.params)
+    futures = pending_torrent_adds.get(key)
+    if not futures:
+        return
+    future = futures.pop(0)
+    if not futures:
+        del pending_torrent_adds[key]
+    if future.done():
+        return
+    if alert.error.value():
+        future.set_exception(RuntimeError(alert.error.message()))
+    else:
+        future.set_result(alert.handle)
+
+
+# Exact alert type -> handler; alerts of any other type are ignored.
+ALERT_HANDLERS = {
+    lt.add_torrent_alert: _on_add_torrent,
+    lt.metadata_received_alert: _on_metadata_received,
+    lt.torrent_finished_alert: _on_torrent_finished,
+    lt.torrent_error_alert: _on_torrent_error,
+    lt.piece_finished_alert: _on_piece_finished,
+    lt.state_update_alert: _on_state_update,
+}
 
 
 async def alert_listener():
     """Listens for and processes libtorrent alerts."""
     ses = get_session()
+    loop = asyncio.get_running_loop()
+    alerts_pending = asyncio.Event()
+
+    def _on_alerts_pending():
+        # Runs on a libtorrent thread when the alert queue goes from empty to
+        # non-empty; it must not call back into the session.
+        try:
+            loop.call_soon_threadsafe(alerts_pending.set)
+        except RuntimeError:
+            pass  # Event loop already closed during shutdown
+
+    try:
+        ses.set_alert_notify(_on_alerts_pending)
+    except (AttributeError, TypeError):
+        alerts_pending = None
+        logging.info("libtorrent has no set_alert_notify; waiting with wait_for_alert")
+
+    # Dispatch on the Python class: type() is a pointer read, whereas
+    # alert.type() would be a call into the bindings for every alert.
+    get_handler = ALERT_HANDLERS.get
+    next_status_update = 0
     while True:
-        alerts = ses.pop_alerts()
-        for alert in alerts:
-            if isinstance(alert, lt.metadata_received_alert):
-                h = alert.handle
-                info_hash = str(h.info_hash())
-                if info_hash in active_torrents:
-                    info = h.get_torrent_info()
-                    files = []
-                    for i in range(info.num_files()):
-                        file_entry = info.file_at(i)
-                        files.append({
-                            "index": i,
-                            "name": file_entry.path,
-                            "size": file_entry.size,
-                            "progress": 0.0,
-                            "is_video": any(file_entry.path.lower().endswith(ext) for ext in ['.mp4', '.mkv', '.avi', '.mov'])
-                        })
-                    active_torrents[info_hash]["info"] = info
-                    active_torrents[info_hash]["name"] = info.name()
-                    active_torrents[info_hash]["files"] = files
-                    active_torrents[info_hash]["status"] = "downloading"
-                    logging.info(f"Metadata received for {info.name()}")
-
-            elif isinstance(alert, lt.torrent_finished_alert):
-                h = alert.handle
-                info_hash = str(h.info_hash())
-                if info_hash in active_torrents:
-                    active_torrents[info_hash]["status"] = "completed"
-                logging.info(f"Torrent finished: {info_hash}")
-
-            elif isinstance(alert, lt.torrent_error_alert):
-                h = alert.handle
-                info_hash = str(h.info_hash())
-                if info_hash in active_torrents:
-                    active_torrents[info_hash]["status"] = "error"
-                    active_torrents[info_hash]["error"] = alert.error.message()
-                logging.error(f"Torrent error for {info_hash}: {alert.error.message()}")
-
-        await asyncio.sleep(1)
+        if loop.time() >= next_status_update:
+            ses.post_torrent_updates()
+            next_status_update = loop.time() + STATUS_UPDATE_INTERVAL_SECONDS
+
+        if alerts_pending is not None:
+            # Sleep until libtorrent signals new alerts or the next status update is due
+            try:
+                await asyncio.wait_for(
+                    alerts_pending.wait(),
+                    timeout=max(0, next_status_update - loop.time()),
+                )
+            except asyncio.TimeoutError:
+                pass
+            alerts_pending.clear()
+        else:
+            # Block in libtorrent's own wait (off the event loop) until alerts are queued
+            await loop.run_in_executor(_alert_wait_executor, ses.wait_for_alert, ALERT_WAIT_TIMEOUT_MS)
+
+        # Drain the whole batch in one pop_alerts() call
+        for alert in ses.pop_alerts():
+            handler = get_handler(type(alert))
+            if handler:
+                handler(alert)
+        _flush_alert_log()
+
+
+async def _cleanup_hls_stream(torrent_id, torrent_info, last_accessed):
+    """
+    Kills the torrent's ffmpeg process and deletes its HLS files. Runs under
+    the same per-torrent lock as HLS startup so a stream being (re)started
+    isn't torn down halfway.
+    """
+    async with _get_torrent_lock(torrent_info):
+        if torrent_info.get("hls_last_accessed") != last_accessed:
+            return  # Accessed again while we waited for the lock
+
+        # Stop the pacer and ffmpeg: SIGTERM, then SIGKILL if it hasn't exited in time.
+        # _watch_ffmpeg_exit logs the stop of a process that was running.
+        await _terminate_hls_process(torrent_info)
+        torrent_info["hls_last_accessed"] = None
+
+        # Delete HLS files off the event loop; large sessions hold many segments
+        hls_output_dir = os.path.join(HLS_PATH, torrent_id)
+        await asyncio.to_thread(shutil.rmtree, hls_output_dir, ignore_errors=True)
+        logging.info(f"Deleted HLS directory: {hls_output_dir}")
+
+        # Don't pause the torrent - let it continue downloading
+
+
+async def _expire_hls_streams(now_monotonic):
+    """Cleans up HLS streams whose expiry deadline has passed, re-scheduling live ones."""
+    timeout_seconds = WARM_CACHE_TIMEOUT_MINUTES * 60
+    while hls_expiry_heap and hls_expiry_heap[0][0] <= now_monotonic:
+        deadline, torrent_id = heapq.heappop(hls_expiry_heap)
+        torrent_info = active_torrents.get(torrent_id)
+        if not torrent_info or torrent_info.get("hls_expiry_deadline") != deadline:
+            continue  # Torrent removed, or a stale entry
+        torrent_info["hls_expiry_deadline"] = None
+
+        # hls_last_accessed is a time.monotonic() stamp
+        last_accessed = torrent_info.get("hls_last_accessed")
+        if last_accessed is None:
+            continue
+        if now_monotonic - last_accessed <= timeout_seconds:
+            schedule_hls_expiry(torrent_id, torrent_info, last_accessed + timeout_seconds)
+            continue
+
+        logging.info(f"HLS stream for {torrent_id} is inactive. Cleaning up.")
+        await _cleanup_hls_stream(torrent_id, torrent_info, last_accessed)
 
 
 async def cleanup_inactive_streams():
@@ -68,15 +275,32 @@ async def cleanup_inactive_streams():
     If a stream is inactive for too long, it kills the ffmpeg process,
     deletes the HLS files, and reverts the torrent to a paused state.
     """
+    state_changed = get_state_changed_event()
+    next_torrent_scan = time.monotonic() + CLEANUP_INTERVAL_SECONDS
     while True:
-        await asyncio.sleep(60)  # Check every minute
-        now = datetime.now()
-        
+        # Sleep until the next HLS expiry or torrent scan, or until state changes
+        wake_at = next_torrent_scan
+        if hls_expiry_heap:
+            wake_at = min(wake_at, hls_expiry_heap[0][0])
+        try:
+            await asyncio.wait_for(state_changed.wait(), timeout=max(0, wake_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+        state_changed.clear()
+
+        await _expire_hls_streams(time.monotonic())
+
+        if time.monotonic() < next_torrent_scan:
+            continue
+        now = time.monotonic()
+        next_torrent_scan = now + CLEANUP_INTERVAL_SECONDS
+        inactive_seconds = INACTIVE_TORRENT_DELETE_MINUTES * 60
+
         for torrent_id, torrent_info in list(active_torrents.items()):
-            last_accessed = torrent_info.get("hls_last_accessed")
-            last_activity_at = torrent_info.get("last_activity_at") or torrent_info.get("added_time")
+            # last_activity_at is a time.monotonic() stamp
+            last_activity_at = torrent_info.get("last_activity_at")
 
-            if last_activity_at and (now - last_activity_at) > timedelta(minutes=INACTIVE_TORRENT_DELETE_MINUTES):
+            if last_activity_at is not None and now - last_activity_at > inactive_seconds:
                 logging.info(
                     "Torrent %s inactive for over %s minutes. Removing torrent data.",
                     torrent_id,
@@ -86,44 +310,6 @@ async def cleanup_inactive_streams():
                     await _remove_torrent_data(torrent_id)
                 except Exception as exc:
                     logging.error("Failed to auto-remove inactive torrent %s: %s", torrent_id, exc)
-                continue
-
-            if last_accessed and (now - last_accessed) > timedelta(minutes=WARM_CACHE_TIMEOUT_MINUTES):
-                logging.info(f"HLS stream for {torrent_id} is inactive. Cleaning up.")
-                
-                # Kill ffmpeg process
-                process = torrent_info.get("hls_process")
-                pacer_task = torrent_info.get("hls_pacer_task")
-                if pacer_task and not pacer_task.done():
-                    pacer_task.cancel()
-                torrent_info["hls_pacer_task"] = None
-
-                if process and process.returncode is None:
-                    try:
-                        if torrent_info.get("hls_process_paused"):
-                            try:
-                                os.kill(process.pid, signal.SIGCONT)
-                            except ProcessLookupError:
-                                pass
-                            torrent_info["hls_process_paused"] = False
-
-                        process.terminate()
-                        await process.wait()
-                        logging.info(f"Terminated ffmpeg process for {torrent_id}")
-                    except ProcessLookupError:
-                        pass # Process already dead
-                
-                torrent_info["hls_process"] = None
-                torrent_info["hls_process_paused"] = False
-                torrent_info["hls_last_accessed"] = None
-                
-                # Delete HLS files
-                hls_output_dir = os.path.join(HLS_PATH, torrent_id)
-                if os.path.exists(hls_output_dir):
-                    shutil.rmtree(hls_output_dir)
-                    logging.info(f"Deleted HLS directory: {hls_output_dir}")
-                    
-                # Don't pause the torrent - let it continue downloading
 
 
 async def log_download_speeds(interval_seconds=5):
@@ -136,7 +322,7 @@ async def log_download_speeds(interval_seconds=5):
                 continue
 
             try:
-                status = handle.status()
+                status = get_status_snapshot(torrent_info)
             except RuntimeError:
                 continue
 
@@ -148,3 +334,46 @@ async def log_download_speeds(interval_seconds=5):
                 status.state,
                 status.progress * 100,
             )
+
+
+def _reap_process(pid):
+    """Returns True once pid has exited (or is no longer our child)."""
+    try:
+        reaped_pid, _ = os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        return True
+    return reaped_pid != 0
+
+
+def _kill_all_ffmpeg():
+    """
+    Exit hook: stops every ffmpeg the server started so none outlive it,
+    even if shutdown skipped the normal cleanup. Runs after the event loop
+    is gone, so it signals and reaps the pids directly.
+    """
+    pids = []
+    for torrent_id in list(hls_streaming_ids):
+        process = active_torrents.get(torrent_id, {}).get("hls_process")
+        if process and process.returncode is None:
+            pids.append(process.pid)
+    for pid in pids:
+        for sig in (signal.SIGCONT, signal.SIGTERM):  # SIGCONT wakes paused processes
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                break
+
+    deadline = time.monotonic() + FFMPEG_EXIT_GRACE_SECONDS
+    while pids and time.monotonic() < deadline:
+        pids = [pid for pid in pids if not _reap_process(pid)]
+        if pids:
+            time.sleep(0.05)
+
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+atexit.register(_kill_all_ffmpeg)
@@ -13,7 +13,12 @@ CLEANUP_INTERVAL_HOURS = 12
 BASE_DIR = Path(__file__).resolve().parent.parent
 DOWNLOAD_PATH = Path(os.getenv("DOWNLOAD_PATH", str(BASE_DIR / "downloads"))).resolve()
 HLS_PATH = Path(os.getenv("HLS_PATH", str(BASE_DIR / "hls"))).resolve()
+# When set (e.g. "/_hls/"), HLS segments are handed to a fronting nginx/caddy
+# via X-Accel-Redirect instead of being streamed through uvicorn.
+HLS_ACCEL_REDIRECT_PREFIX = os.getenv("HLS_ACCEL_REDIRECT_PREFIX", "")
 WARM_CACHE_TIMEOUT_MINUTES = 20
+# Head of the preferred video file fetched first once metadata arrives; 0 disables.
+WARM_CACHE_SIZE_MB = int(os.getenv("WARM_CACHE_SIZE_MB", 50))
 INACTIVE_TORRENT_DELETE_MINUTES = int(os.getenv("INACTIVE_TORRENT_DELETE_MINUTES", 90))
 
 # Diagnostic: log all environment variables at startup
@@ -24,5 +29,7 @@ for k, v in os.environ.items():
 # Log the resolved paths at import time for debugging
 logging.info(f"[CONFIG] DOWNLOAD_PATH: {DOWNLOAD_PATH}")
 logging.info(f"[CONFIG] HLS_PATH: {HLS_PATH}")
+logging.info(f"[CONFIG] HLS_ACCEL_REDIRECT_PREFIX: {HLS_ACCEL_REDIRECT_PREFIX or '(disabled)'}")
 logging.info(f"[CONFIG] TORRENT_PORT: {TORRENT_PORT}")
 logging.info(f"[CONFIG] INACTIVE_TORRENT_DELETE_MINUTES: {INACTIVE_TORRENT_DELETE_MINUTES}")
+logging.info(f"[CONFIG] WARM_CACHE_SIZE_MB: {WARM_CACHE_SIZE_MB}")
@@ -1,27 +1,104 @@
-from datetime import datetime
+import asyncio
+import heapq
 import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, TypedDict
+
 import libtorrent as lt
 
+
+class TorrentState(TypedDict, total=False):
+    """
+    Per-torrent state kept in active_torrents. A TypedDict rather than a class
+    so every module keeps using plain dict access; keys beyond the ones set in
+    add_torrent are filled in lazily as metadata, status and streams appear.
+    """
+    handle: lt.torrent_handle
+    hash: str  # Lowercase hex, same as the active_torrents key
+    status: str  # "metadata" | "downloading" | "completed" | "error"
+    added_time: datetime
+    last_activity_at: float  # time.monotonic()
+    error: str
+    metadata_ready: asyncio.Event
+
+    # Set on metadata_received_alert
+    info: lt.torrent_info
+    name: str
+    files: List[Dict[str, Any]]
+    video_file: Optional[Dict[str, Any]]
+    video_file_index: int
+
+    # Caches filled by status and streaming code
+    cached_status: Any  # lt.torrent_status from the last state_update_alert
+    static_status: Dict[str, Any]
+    file_layouts: Dict[int, Dict[str, int]]
+    file_priorities: Tuple[int, ...]
+    have_pieces: bytearray
+    piece_waiters: List[Tuple[int, int, asyncio.Event]]
+
+    # Probed stream properties
+    stream_bytes_per_second: int
+    stream_duration_seconds: float
+    stream_video_codec: Optional[str]
+    stream_audio_codec: Optional[str]
+    stream_audio_channels: Optional[int]
+    stream_audio_stream_index: Optional[int]
+
+    # HLS / ffmpeg
+    hls_lock: asyncio.Lock
+    hls_process: Optional[asyncio.subprocess.Process]
+    hls_pacer_task: Optional[asyncio.Task]
+    hls_process_paused: bool
+    hls_start_segment: int
+    hls_command_version: int
+    hls_realtime_input: bool
+    hls_last_accessed: Optional[float]  # time.monotonic()
+    hls_expiry_deadline: Optional[float]  # this torrent's live entry in hls_expiry_heap
+
+
 # --- In-memory State ---
-# This dictionary will hold the state of all torrents managed by the application.
-# It's a simple, in-memory database.
-active_torrents = {}
-
-# Structure for each torrent in active_torrents:
-# {
-#   "torrent_hash": {
-#     "handle": lt.torrent_handle,
-#     "info": lt.torrent_info,
-#     "status": "warming_cache" | "paused" | "downloading" | "seeding" | "error",
-#     "name": str,
-#     "files": list,
-#     "added_at": datetime,
-#     "last_accessed_at": datetime,
-#     "error": str | None,
-#     "hls_process": asyncio.subprocess.Process | None,
-#     "hls_last_accessed": datetime | None
-#   }
-# }
+# This dictionary will hold the state of all torrents managed by the application,
+# keyed by lowercase info hash. It's a simple, in-memory database.
+active_torrents: Dict[str, TorrentState] = {}
+
+# Set when torrents are added, removed or change state so cleanup_inactive_streams
+# rescans right away. Created lazily: on Python 3.9 an asyncio.Event binds to the
+# loop current at construction, which at import time isn't uvicorn's.
+_state_changed = None
+
+
+def get_state_changed_event():
+    global _state_changed
+    if _state_changed is None:
+        _state_changed = asyncio.Event()
+    return _state_changed
+
+
+def notify_state_changed():
+    get_state_changed_event().set()
+
+
+# Ids of torrents with a running HLS ffmpeg, so code that only cares about
+# streams doesn't walk every torrent in active_torrents.
+hls_streaming_ids: Set[str] = set()
+
+
+# Futures waiting on the add_torrent_alert for an async_add_torrent call, keyed
+# by add_params_hash; alert_listener resolves them in order with the handle.
+pending_torrent_adds: Dict[str, List[asyncio.Future]] = {}
+
+
+# Min-heap of (monotonic deadline, torrent_id) for HLS inactivity expiry, so
+# cleanup_inactive_streams sleeps until the next deadline instead of scanning.
+# Each torrent has at most one live entry, matched by its hls_expiry_deadline.
+hls_expiry_heap: List[Tuple[float, str]] = []
+
+
+def schedule_hls_expiry(torrent_id, torrent_info, deadline):
+    torrent_info["hls_expiry_deadline"] = deadline
+    heapq.heappush(hls_expiry_heap, (deadline, torrent_id))
+    if hls_expiry_heap[0] == (deadline, torrent_id):
+        notify_state_changed()  # Earliest deadline moved; let cleanup re-arm its sleep
 
 # --- libtorrent Session ---
 # Global session object for libtorrent
@@ -66,6 +143,20 @@ def _bootstrap_peer_discovery(session):
     _start_optional_service(session, "start_upnp")
     _start_optional_service(session, "start_natpmp")
 
+def _consumed_alert_categories():
+    """
+    status (metadata, finished, state_update), error (torrent_error) and
+    whichever category carries piece_finished_alert: progress_notification on
+    older bindings, piece_progress_notification from libtorrent 1.2 on.
+    """
+    categories = lt.alert.category_t
+    mask = categories.status_notification | categories.error_notification
+    for name in ("progress_notification", "piece_progress_notification"):
+        category = getattr(categories, name, None)
+        if category is not None:
+            mask |= category
+    return mask
+
 def get_session():
     """Returns the global libtorrent session, creating it if it doesn't exist."""
     global ses
@@ -73,7 +164,10 @@ def get_session():
         from src.config import TORRENT_PORT
         ses = lt.session({
             'listen_interfaces': f'0.0.0.0:{TORRENT_PORT}',
-            'alert_mask': lt.alert.category_t.all_categories,
+            # Only the categories alert_listener consumes; OR in more as needed.
+            'alert_mask': _consumed_alert_categories(),
+            # piece_finished alerts arrive in bursts; don't drop metadata/error alerts behind them
+            'alert_queue_size': 10000,
             'user_agent': 'plays96/1.0.0',
             'download_rate_limit': 0,
             'upload_rate_limit': 0,
@@ -1,5 +1,89 @@
+import os
+
 import libtorrent as lt
 
+VIDEO_EXTENSIONS = frozenset({
+    '.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.webm', '.mpg', '.mpeg', '.m4v',
+})
+
+
+def is_video_path(path):
+    """
+    Returns True if the path ends in a known video extension. splitext only
+    slices off the extension, so long paths are not lowercased as a whole.
+    """
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+
+def build_file_list(info):
+    """
+    Builds the per-file dicts stored as torrent_info["files"] from an
+    lt.torrent_info, reading paths and sizes straight off its file_storage
+    instead of materialising a file_entry object per file.
+
+    Returns (files, video_file), where video_file is what
+    get_preferred_stream_file(files) would pick, found in the same pass.
+    """
+    file_storage = info.files()
+    file_size = file_storage.file_size
+    paths = map(file_storage.file_path, range(file_storage.num_files()))
+    files = []
+    video_file = None
+    for i, path in enumerate(paths):
+        file = {
+            "index": i,
+            "name": path,
+            "size": file_size(i),
+            "progress": 0.0,
+            "is_video": is_video_path(path),
+        }
+        if video_file is None and file["is_video"]:
+            video_file = file
+        files.append(file)
+
+    if video_file is None and files:
+        video_file = files[0]
+    return files, video_file
+
+
+def add_params_hash(params):
+    """
+    Hex info hash of an lt.add_torrent_params, used to match add_torrent_alerts
+    back to the request that queued them.
+    """
+    info_hashes = getattr(params, "info_hashes", None)  # libtorrent 2.x
+    if info_hashes is not None:
+        return str(info_hashes.v1 if info_hashes.has_v1() else info_hashes.v2).lower()
+    return str(params.info_hash).lower()
+
+
+def get_cached_torrent_info(torrent_info):
+    """
+    Returns the torrent's lt.torrent_info, fetched from the handle at most once.
+    torrent_info is immutable after metadata arrives, so every caller can share
+    the copy stored by the metadata_received handler. Returns None before then.
+    """
+    info = torrent_info.get("info")
+    if info is None:
+        handle = torrent_info["handle"]
+        if not handle.has_metadata():
+            return None
+        info = handle.get_torrent_info()
+        torrent_info["info"] = info
+    return info
+
+
+def get_status_snapshot(torrent_info):
+    """
+    Returns the torrent's lt.torrent_status from the last state_update_alert,
+    falling back to a handle.status() round-trip before the first one arrives.
+    """
+    status = torrent_info.get("cached_status")
+    if status is None:
+        status = torrent_info["handle"].status()
+    return status
+
+
 def get_torrent_status(torrent_info):
     """
     Converts a torrent info dictionary to a detailed status dictionary.
@@ -18,13 +102,8 @@ def get_torrent_status(torrent_info):
             "files": [],
         }
 
-    s = handle.status()
-    info = handle.get_torrent_info()
-    
-    files = []
-    if info and info.num_files() > 0:
-        files = [to_dict(info.file_at(i), i) for i in range(info.num_files())]
-    # If info isn't ready, files will be an empty list, which is the correct state.
+    s = get_status_snapshot(torrent_info)
+    static_status = _get_static_status(torrent_info)
 
     status_str = torrent_info.get("status", str(s.state))
     progress = s.progress * 100
@@ -32,30 +111,50 @@ def get_torrent_status(torrent_info):
         progress = 0.0
 
     return {
-        "hash": str(s.info_hashes.v1).lower() if s.info_hashes.v1 else str(s.info_hashes.v2).lower(),
-        "name": info.name() if info else "N/A",
+        "hash": _get_hash_string(torrent_info, s),
+        "name": static_status["name"],
         "status": status_str,
         "progress": progress,
         "download_rate": s.download_rate / 1000,  # KB/s
         "upload_rate": s.upload_rate / 1000,    # KB/s
         "num_peers": s.num_peers,
-        "files": files,
+        "files": static_status["files"],
     }
 
-def to_dict(file_entry, index=None):
+def _get_hash_string(torrent_info, status):
     """
-    Converts a libtorrent file_entry to a dictionary that matches our Pydantic model.
+    Returns the torrent's hex hash, stored once at add time; only entries
+    created without one fall back to formatting it from the status.
     """
-    video_extensions = ['.mkv', '.mp4', '.avi', '.mov', '.flv', '.wmv']
-    is_video = any(file_entry.path.lower().endswith(ext) for ext in video_extensions)
-    
-    return {
-        'index': index,
-        'name': file_entry.path,
-        'size': file_entry.size,
-        'progress': 0.0,  # Default progress to 0, it will be updated later
-        'is_video': is_video
+    hash_str = torrent_info.get("hash")
+    if hash_str is None:
+        info_hashes = status.info_hashes
+        hash_str = str(info_hashes.v1).lower() if info_hashes.v1 else str(info_hashes.v2).lower()
+        torrent_info["hash"] = hash_str
+    return hash_str
+
+def _get_static_status(torrent_info):
+    """
+    Returns the parts of the status that never change once metadata is known
+    (name and file list), reusing the file list built by the metadata handler
+    and caching the pair on first use.
+    """
+    static_status = torrent_info.get("static_status")
+    if static_status is not None:
+        return static_status
+
+    info = get_cached_torrent_info(torrent_info)
+    files = torrent_info.get("files")
+    if not info or not files:
+        # Until the metadata handler stores the file list, empty is the correct state.
+        return {"name": info.name() if info else "N/A", "files": []}
+
+    static_status = {
+        "name": torrent_info.get("name") or info.name(),
+        "files": files,
     }
+    torrent_info["static_status"] = static_status
+    return static_status
 
 def get_preferred_stream_file(files):
     """Finds the preferred stream file in a list of files.
@@ -71,8 +170,3 @@ def get_preferred_stream_file(files):
             return file
 
     return files[0]
-
-
-def get_largest_video_file(files):
-    """Backward-compatible alias for the preferred stream file selection."""
-    return get_preferred_stream_file(files)